@@ -0,0 +1,236 @@
+import streamlit as st
+import requests
+from urllib3.util import Retry
+import pandas as pd
+import numpy as np
+import shapely
+import folium
+from branca.colormap import LinearColormap
+from branca.element import MacroElement
+from jinja2 import Template
+import os
+
+# Code shared by app.py and app_MS.py: ward data, the ward map and the prediction API client.
+# Keeping it in one module stops the two apps drifting apart.
+
+# Source CSV with the ward boundaries (WKT) and demographics
+csv_path = os.path.join("raw_data", "ward_demographics_boundaries.csv")
+
+# Simplified GeoParquet copy of the CSV, built by `make ward_parquet` and committed so boots
+# skip the WKT parse and the simplification (the CSV is parsed instead if the copy is stale)
+parquet_path = os.path.join("raw_data", "ward_demographics_boundaries_simplified.parquet")
+
+# Define GeoDataFrame and column mappings
+percentage_columns = [
+    "Race-White_pct", "Race-Black_pct", "Race-Asian_pct",
+    "Ethnicity-Hispanic_pct", "Income-24999_minus_pct",
+    "Income-25000-49999_pct", "Income-50000-99999_pct",
+    "Income-100000-149999_pct", "Income-150000_plus_pct"
+]
+layer_name_mapping = {
+    "Race-White_pct": "White Population (%)",
+    "Race-Black_pct": "Black Population (%)",
+    "Race-Asian_pct": "Asian Population (%)",
+    "Ethnicity-Hispanic_pct": "Hispanic Population (%)",
+    "Income-24999_minus_pct": "Income <$25k (%)",
+    "Income-25000-49999_pct": "Income $25k-$50k (%)",
+    "Income-50000-99999_pct": "Income $50k-$100k (%)",
+    "Income-100000-149999_pct": "Income $100k-$150k (%)",
+    "Income-150000_plus_pct": "Income >$150k (%)"
+}
+race_columns = ["Race-White_pct", "Race-Black_pct", "Race-Asian_pct", "Ethnicity-Hispanic_pct"]
+income_columns = [
+    "Income-24999_minus_pct", "Income-25000-49999_pct", "Income-50000-99999_pct",
+    "Income-100000-149999_pct", "Income-150000_plus_pct"
+]
+
+# Shared colormap for every demographic column
+colormap = LinearColormap(['green', 'yellow', 'red'],
+                          vmin=0, vmax=100,
+                          caption='Percentage (%)')  # Add caption for the legend
+
+# Simplify and Cache GeoDataFrame
+@st.cache_resource
+def load_and_process_data(csv_path, parquet_path):
+    # geopandas is only needed to build the cached data, so the loader is imported on a cache miss
+    from build_ward_parquet import load_wards
+
+    gdf = load_wards(csv_path, parquet_path)
+    # Precompute every ward's fill colour for each column so styling is a property lookup.
+    # Colours come from a hex table for every whole percentage (0-100), indexed once per column.
+    colormap_lut = np.array([colormap(value) for value in range(101)])
+    ward_layer = gdf[["Ward", *percentage_columns, "the_geom"]].copy()
+    for column in percentage_columns:
+        percentages = np.clip(np.rint(ward_layer[column].to_numpy(dtype=np.float64)), 0, 100)
+        ward_layer[f"_fill_{column}"] = colormap_lut[percentages.astype(np.intp)]
+    # Snap browser coordinates to a ~1 m grid; full double precision roughly doubles the payload
+    ward_layer['the_geom'] = ward_layer['the_geom'].set_precision(1e-5)
+    # Build the simplified wards' GeoJSON once with only the columns the map reads. It stays a dict:
+    # folium would json.loads a string straight back before its template encodes it.
+    # Feature ids are dropped too: folium falls back to the unique Ward property.
+    ward_geojson = ward_layer.to_geo_dict(drop_id=True)
+    # Demographics for the prediction charts as one array per column, plus each ward's row position.
+    # float64 keeps the CSV's values exact, so chart tooltips show 65.3 rather than float32 noise.
+    demographics = {col: gdf[col].to_numpy(dtype=np.float64) for col in race_columns + income_columns}
+    ward_index = {int(ward): i for i, ward in enumerate(gdf['Ward'])}
+    return gdf, ward_geojson, demographics, ward_index
+
+# Function to find the ward of the loaded GeoDataFrame for a given latitude and longitude
+def find_ward(gdf, lat, lon):
+    point = shapely.Point(lon, lat)  # Create a Point (longitude first)
+    # R-tree lookup plus exact test in one GEOS call; "within" tests the point against each ward
+    hits = gdf.sindex.query(point, predicate="within")
+    if hits.size:
+        return int(gdf['Ward'].iat[hits[0]])  # Plain int so the ward is JSON serializable
+    return None  # Return None if no ward contains the point
+
+# Leaflet control that restyles the ward layer in the browser when another column is picked.
+# It also owns the tooltip, which shows the ward and the value of the column on display.
+class ColumnSelector(MacroElement):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.control({position: 'topright'});
+        {{ this.get_name() }}.onAdd = function (map) {
+            var div = L.DomUtil.create('div', 'leaflet-bar');
+            var select = L.DomUtil.create('select', '', div);
+            {% for column, label in this.columns.items() %}
+            select.add(new Option({{ label|tojson }}, {{ column|tojson }}));
+            {% endfor %}
+            L.DomEvent.disableClickPropagation(div);
+            // The tooltip reads the selection when it opens, so it follows the column switch
+            {{ this.layer.get_name() }}.bindTooltip(function (ward) {
+                var properties = ward.feature.properties;
+                var label = select.options[select.selectedIndex].text;
+                return "<table><tr><th>Ward:</th><td>" + properties.Ward + "</td></tr>"
+                    + "<tr><th>" + label + " :</th><td>"
+                    + properties[select.value].toLocaleString() + "</td></tr></table>";
+            }, {sticky: true});
+            select.onchange = function () {
+                var fillProperty = "_fill_" + select.value;
+                var style = function (feature) {
+                    return {
+                        fillColor: feature.properties[fillProperty],
+                        color: "blue",
+                        weight: 1.5,
+                        fillOpacity: 0.6
+                    };
+                };
+                // resetStyle() on mouseout falls back to options.style, so keep it in sync
+                {{ this.layer.get_name() }}.options.style = style;
+                {{ this.layer.get_name() }}.setStyle(style);
+            };
+            return div;
+        };
+        {{ this.get_name() }}.addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, columns):
+        super().__init__()
+        self._name = "ColumnSelector"
+        self.layer = layer
+        self.columns = columns
+
+# Define the function to create the ward layer, styled by the first column
+def create_layer(geojson, column_name):
+    fill_property = f"_fill_{column_name}"
+
+    def style_function(feature):
+        return {
+            "fillColor": feature['properties'][fill_property],
+            "color": "blue",
+            "weight": 1.5,
+            "fillOpacity": 0.6,
+        }
+
+    # The fill is left alone so the highlight works for whichever column is selected
+    def highlight_function(feature):
+        return {
+            "color": "red",
+            "weight": 2,
+            "fillOpacity": 0.8,
+        }
+
+    # Build the GeoJSON layer with the defined style; ColumnSelector adds the tooltip for the shown column
+    return folium.GeoJson(
+        geojson,
+        name="Wards",
+        style_function=style_function,
+        highlight_function=highlight_function,
+    )
+
+# Function to build the ward map. A fresh Map is built for every render (a few ms): st_folium
+# re-renders the Map it is given and folium appends to its script each time, so a cached Map keeps growing.
+def build_map(geojson):
+    # Initialize map
+    chicago_coords = [41.8781, -87.6298]
+    m = folium.Map(location=chicago_coords, zoom_start=10)
+
+    # Send the polygons once and switch the displayed column client-side
+    ward_layer = create_layer(geojson, percentage_columns[0]).add_to(m)
+    ColumnSelector(ward_layer, layer_name_mapping).add_to(m)
+
+    # Add colormap (legend) to the map
+    colormap.add_to(m)
+    return m
+
+# Shared HTTP session so repeated predictions reuse the pooled TLS connection
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    # Retry transient Cloud Run errors; a prediction has no side effects, so POST is safe to repeat.
+    # Once retries run out the last response is returned, so raise_for_status() still raises HTTPError.
+    retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504],
+                    allowed_methods={"POST"}, raise_on_status=False)
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8,
+                                                            max_retries=retries))
+    return session
+
+# Cache predictions in memory so repeating an identical request is served locally. The ttl lets a
+# redeployed model's answers replace old ones within the hour.
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_prediction(api_url, payload):
+    response = get_session().post(api_url, json=payload, timeout=(3, 10))
+    response.raise_for_status()
+    return response.json()
+
+# The demographics never change, so each ward's charts are built once and kept as one Vega-Lite spec
+@st.cache_data(show_spinner=False)
+def build_demographic_spec(ward):
+    import altair as alt
+
+    # Look up the position of the ward in the cached demographic arrays
+    _, _, demographics, ward_index = load_and_process_data(csv_path, parquet_path)
+    ward_position = ward_index[ward]
+
+    # 1. Pie Chart for Race Distribution
+    race_values = np.array([demographics[col][ward_position] for col in race_columns])
+    race_labels = [layer_name_mapping[col] for col in race_columns]
+
+    race_fig = alt.Chart(pd.DataFrame({"Group": race_labels, "Percentage": race_values})).mark_arc().encode(
+        theta="Percentage:Q",
+        color=alt.Color("Group:N", sort=race_labels),
+        tooltip=["Group:N", "Percentage:Q"],
+    ).properties(title="Race Distribution")
+
+    # # 2. Pie Chart for Ethnicity Distribution
+    # ethnicity_values = [demographics["Ethnicity-Hispanic_pct"][ward_position],
+    #                     100 - demographics["Ethnicity-Hispanic_pct"][ward_position]]
+    # ethnicity_labels = ["Hispanic", "Non-Hispanic"]
+
+    # ethnicity_fig = alt.Chart(pd.DataFrame({"Group": ethnicity_labels, "Percentage": ethnicity_values})).mark_arc().encode(
+    #     theta="Percentage:Q", color="Group:N").properties(title="Ethnicity Distribution")
+
+    # 3. Bar Chart for Income Distribution
+    income_values = np.array([demographics[col][ward_position] for col in income_columns])
+    income_labels = [layer_name_mapping[col] for col in income_columns]
+
+    income_fig = alt.Chart(pd.DataFrame({"Income Range": income_labels, "Percentage": income_values})).mark_bar(
+        color='lightcoral'
+    ).encode(
+        x=alt.X("Income Range:N", title="Income Ranges", sort=income_labels),
+        y=alt.Y("Percentage:Q", title="Percentage (%)"),
+    ).properties(title="Income Distribution")
+
+    # Send both charts side by side as a single spec instead of one chart element each
+    return alt.hconcat(race_fig, income_fig).to_dict()
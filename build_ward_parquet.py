@@ -0,0 +1,50 @@
+import os
+import hashlib
+import logging
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Conversion of the ward CSV into the simplified GeoParquet file the apps load.
+# Run `make ward_parquet` after editing the CSV and commit the result; both apps import load_wards.
+csv_path = os.path.join("raw_data", "ward_demographics_boundaries.csv")
+parquet_path = os.path.join("raw_data", "ward_demographics_boundaries_simplified.parquet")
+
+# Function to fingerprint the CSV so a parquet copy built from an older CSV can be spotted
+def csv_digest(csv_path):
+    with open(csv_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+# Function to parse and simplify the ward CSV in memory
+def read_ward_csv(csv_path):
+    ward_bound = pd.read_csv(csv_path)
+    # Convert WKT strings to Shapely geometry objects in one vectorized call
+    ward_bound['the_geom'] = shapely.from_wkt(ward_bound['the_geom'].to_numpy())
+    # Simplify every polygon in one vectorized GEOS call
+    ward_bound['the_geom'] = shapely.simplify(ward_bound['the_geom'].to_numpy(),
+                                              tolerance=0.001, preserve_topology=True)
+    # Create a GeoDataFrame, recording its source CSV (stored in the parquet metadata)
+    gdf = gpd.GeoDataFrame(ward_bound, geometry='the_geom', crs="EPSG:4326")
+    gdf.attrs["source_sha256"] = csv_digest(csv_path)
+    return gdf
+
+# Function to load the wards: the parquet copy if it matches the CSV, otherwise the CSV itself.
+# Nothing is written, so the apps also run from a read-only checkout.
+def load_wards(csv_path, parquet_path):
+    if os.path.exists(parquet_path):
+        gdf = gpd.read_parquet(parquet_path)
+        if gdf.attrs.get("source_sha256") == csv_digest(csv_path):
+            return gdf
+        logging.getLogger(__name__).warning(
+            "%s was not built from the current %s; parsing the CSV instead. "
+            "Run `make ward_parquet` and commit the result.", parquet_path, csv_path)
+    else:
+        logging.getLogger(__name__).warning(
+            "%s is missing; parsing %s instead. Run `make ward_parquet` and commit the result.",
+            parquet_path, csv_path)
+    return read_ward_csv(csv_path)
+
+if __name__ == "__main__":
+    gdf = read_ward_csv(csv_path)
+    gdf.to_parquet(parquet_path, compression="zstd")
+    print(f"Wrote {len(gdf)} wards to {parquet_path}")